@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import numba
+
+
+@numba.njit(cache=True, fastmath=True)
+def _viterbi_sparse_forward(
+        log_p: np.array,
+        delta: np.array,
+        backpointer: np.array,
+        log_p_stay_silence: float,
+        log_p_l: float,
+        log_p_stay_note: float,
+        log_p_ll: float):
+    """
+    Advances the scores of viterbi_sparse_blocks() over every frame of log_p.
+
+    delta holds the scores of the frame before log_p[:, 0] and is updated
+    in place; backpointer[t] receives the best predecessors of frame t.
+    """
+    n_states, n_frames = log_p.shape
+    n_notes = (n_states - 1) // 2
+
+    delta_new = np.empty_like(delta)
+
+    for t in range(n_frames):
+        # Best sustain to leave from (to silence or to any onset)
+        best_sustain = delta[2] + log_p_ll
+        best_sustain_i = 2
+        for i in range(4, n_states, 2):
+            cand = delta[i] + log_p_ll
+            if cand > best_sustain:
+                best_sustain = cand
+                best_sustain_i = i
+
+        # State 0: silence
+        from_silence = delta[0] + log_p_stay_silence
+        if best_sustain > from_silence:
+            delta_new[0] = best_sustain + log_p[0, t]
+            backpointer[t, 0] = best_sustain_i
+        else:
+            delta_new[0] = from_silence + log_p[0, t]
+            backpointer[t, 0] = 0
+
+        # States 1, 3, 5... = onsets, all with the same best predecessor
+        from_silence = delta[0] + log_p_l
+        if best_sustain > from_silence:
+            best_onset = best_sustain
+            best_onset_i = best_sustain_i
+        else:
+            best_onset = from_silence
+            best_onset_i = 0
+
+        for j in range(n_notes):
+            onset = (j * 2) + 1
+            sustain = (j * 2) + 2
+
+            delta_new[onset] = best_onset + log_p[onset, t]
+            backpointer[t, onset] = best_onset_i
+
+            # States 2, 4, 6... = sustains, reached from their own onset
+            # (with probability 1) or from themselves
+            from_sustain = delta[sustain] + log_p_stay_note
+            if from_sustain > delta[onset]:
+                delta_new[sustain] = from_sustain + log_p[sustain, t]
+                backpointer[t, sustain] = sustain
+            else:
+                delta_new[sustain] = delta[onset] + log_p[sustain, t]
+                backpointer[t, sustain] = onset
+
+        # Keep scores near zero, so float32 inputs do not lose precision
+        # on long sequences. This does not change any max/argmax.
+        delta[:] = delta_new - np.max(delta_new)
+
+
+@numba.njit(cache=True)
+def _backtrack(backpointer: np.array, last_state: int, states: np.array) -> int:
+    """
+    Fills states (as long as backpointer) by following backpointer back
+    from last_state, the state of its last frame. Returns the state of the
+    frame before the first one.
+    """
+    states[-1] = last_state
+    for t in range(len(states) - 2, -1, -1):
+        states[t] = backpointer[t + 1, states[t + 1]]
+    return backpointer[0, states[0]]
+
+
+def viterbi_sparse_blocks(
+        blocks,
+        log_p_init: np.array,
+        log_p_stay_silence: float,
+        log_p_l: float,
+        log_p_stay_note: float,
+        log_p_ll: float) -> np.array:
+    """
+    Finds the most likely state sequence for the silence/onset/sustain HMM
+    described by transition_matrix(), in log-space.
+
+    Only the non-zero transitions are visited: silence goes to itself or to
+    any onset, each onset goes to its own sustain, and each sustain goes to
+    itself, to silence or to any onset. As every onset is reached with the
+    same probabilities, the best predecessor of all onsets is found with a
+    single reduction per frame, which makes each step O(N_notes) instead of
+    O(N_states^2).
+
+    The log-priors arrive in blocks of frames, e.g. from
+    iter_prior_probabilities(). Only the current block of log-priors is
+    held; the (int16) backpointers of all frames are kept for the
+    backtracking. A whole matrix is decoded by passing [(log_p, 0)].
+
+    Parameters
+    ----------
+    blocks : iterable of (2D numpy array, int)
+        Consecutive (log_p_block, t0) pairs, where log_p_block
+        (2*N_notes+1 x N_frames, float32 or float64) holds the log prior
+        probabilities of each state at frames t0, t0+1, ...
+    log_p_init : 1D numpy array (2*N_notes+1)
+        Log probability of starting in each state.
+    log_p_stay_silence : float
+        Log probability of the silence state returning to itself.
+    log_p_l : float
+        Log probability of going from silence to each onset.
+    log_p_stay_note : float
+        Log probability of a sustain state returning to itself.
+    log_p_ll : float
+        Log probability of going from a sustain to silence or to each onset.
+
+    Returns
+    -------
+    states : 1D numpy array of int32
+        Most likely state at each frame.
+    """
+    delta = None
+    backpointers = []
+    for log_p_block, _ in blocks:
+        n_states, n_frames = log_p_block.shape
+        if n_frames == 0:
+            continue
+
+        backpointer = np.zeros((n_frames, n_states), dtype=np.int16)
+        if delta is None:
+            delta = np.empty(n_states, dtype=log_p_block.dtype)
+            delta[:] = log_p_block[:, 0] + log_p_init
+            _viterbi_sparse_forward(
+                log_p_block[:, 1:], delta, backpointer[1:],
+                log_p_stay_silence, log_p_l, log_p_stay_note, log_p_ll)
+        else:
+            _viterbi_sparse_forward(
+                log_p_block, delta, backpointer,
+                log_p_stay_silence, log_p_l, log_p_stay_note, log_p_ll)
+        backpointers.append(backpointer)
+
+    if delta is None:
+        return np.zeros(0, dtype=np.int32)
+
+    # Backtrack block by block, from the last one
+    states = np.zeros(sum(len(b) for b in backpointers), dtype=np.int32)
+    end = len(states)
+    last_state = np.argmax(delta)
+    for backpointer in reversed(backpointers):
+        start = end - len(backpointer)
+        last_state = _backtrack(backpointer, last_state, states[start:end])
+        end = start
+
+    return states
@@ -1,21 +1,50 @@
 # -*- coding: utf-8 -*-
 
+import importlib.util
 import sys
 
 import librosa
+import soundfile as sf
 
 from sound_to_midi.monophonic import wave_to_midi
 
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+BLOCK_LENGTH = 256
+
+
 def run():
     print("Starting...")
     file_in = sys.argv[1]
     file_out = sys.argv[2]
-    audio_data, srate = librosa.load(file_in, sr=None)
-    print("Audio file loaded!")
-    midi = wave_to_midi(audio_data, srate=srate)
+    try:
+        # The file is opened here, as librosa.stream() only opens it when
+        # the first block is read
+        sound_file = sf.SoundFile(file_in)
+        srate = sound_file.samplerate
+        audio = librosa.stream(
+            sound_file, block_length=BLOCK_LENGTH,
+            frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH)
+    except sf.SoundFileRuntimeError:
+        # Streaming reads through soundfile only. Other formats (e.g. m4a,
+        # aac) are decoded whole by librosa.load, which can use audioread.
+        audio, srate = librosa.load(file_in, sr=None)
+    print("Audio file opened!")
+    # symusic writes MIDI files faster, but is an optional dependency
+    if importlib.util.find_spec("symusic") is not None:
+        midi_backend = "symusic"
+    else:
+        midi_backend = "midiutil"
+    midi = wave_to_midi(
+        audio, srate=srate,
+        frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH,
+        midi_backend=midi_backend)
     print("Conversion finished!")
-    with open (file_out, 'wb') as file:
-        midi.writeFile(file)
+    if midi_backend == "symusic":
+        midi.dump_midi(file_out)
+    else:
+        with open (file_out, 'wb') as file:
+            midi.writeFile(file)
     print("Done. Exiting!")
 
 
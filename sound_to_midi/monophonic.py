@@ -1,15 +1,108 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+import numba
+import scipy.sparse
 import librosa
 import midiutil
 
+from sound_to_midi._viterbi import viterbi_sparse_blocks
+
+# Added to probabilities before taking logs, to avoid log(0) (as in librosa)
+_EPSILON = np.finfo(np.float64).tiny
+
+# Signals sampled above this rate are downsampled before frame analysis.
+# It keeps the fundamental and several harmonics of the supported notes,
+# and pyin's cost grows with the sample rate.
+_ANALYSIS_SRATE = 22050
+
+# Pitch estimation only needs the fundamental and a couple of harmonics, so
+# it runs at max(_PITCH_MIN_SRATE, 4 * fmax) when that is lower still.
+_PITCH_MIN_SRATE = 16000
+
+# Note names for every MIDI number, so that naming a note is a lookup.
+# midi_to_note() returns a list before librosa 0.10, an array after.
+_MIDI_TO_NOTE = [str(name) for name in librosa.midi_to_note(np.arange(128))]
+
+
+@numba.njit(cache=True)
+def _log(probability):
+    """
+    Returns the natural log of a probability (or array of probabilities),
+    floored at log(_EPSILON).
+    """
+    return np.log(probability + _EPSILON)
+
+
+def _note_range(note_min: str, note_max: str) -> tuple:
+    """
+    Parses a note range given in 'A#4' format.
+
+    Returns
+    -------
+    midi_min : int
+        MIDI number of the lowest note.
+    n_notes : int
+        Number of notes in the range.
+    fmin, fmax : float
+        Frequencies (Hz) of the lowest and highest notes.
+    """
+    midi_min, midi_max = librosa.note_to_midi([note_min, note_max])
+    fmin, fmax = librosa.midi_to_hz([midi_min, midi_max])
+    return int(midi_min), int(midi_max - midi_min + 1), fmin, fmax
+
+
+def _transition_probabilities(
+        n_notes: int,
+        p_stay_note: float,
+        p_stay_silence: float) -> tuple:
+    """
+    Returns the probabilities (p_l, p_ll) of leaving silence to a given onset
+    and of leaving a sustain to silence or to a given onset.
+    """
+    p_l = (1 - p_stay_silence) / n_notes
+    p_ll = (1 - p_stay_note) / (n_notes + 1)
+    return p_l, p_ll
+
+
+def _sparse_transition_matrix(
+        n_notes: int,
+        p_stay_note: float,
+        p_stay_silence: float) -> scipy.sparse.csr_matrix:
+    """
+    Builds the matrix returned by transition_matrix(..., sparse=True) from
+    the coordinates of its non-zero entries.
+    """
+    p_l, p_ll = _transition_probabilities(n_notes, p_stay_note, p_stay_silence)
+    onsets = np.arange(1, 2 * n_notes + 1, 2)
+    sustains = onsets + 1
+
+    rows = [
+        [0], np.zeros(n_notes, dtype=int),                  # silence
+        onsets,                                             # onsets
+        sustains, sustains, np.repeat(sustains, n_notes)]   # sustains
+    cols = [
+        [0], onsets,
+        sustains,
+        [0] * n_notes, sustains, np.tile(onsets, n_notes)]
+    data = [
+        [p_stay_silence], np.full(n_notes, p_l),
+        np.ones(n_notes),
+        np.full(n_notes, p_ll), np.full(n_notes, p_stay_note),
+        np.full(n_notes * n_notes, p_ll)]
+
+    return scipy.sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(2 * n_notes + 1, 2 * n_notes + 1),
+        dtype=np.float32)
+
 
 def transition_matrix(
         note_min: str,
         note_max: str,
         p_stay_note: float,
-        p_stay_silence: float) -> np.array:
+        p_stay_silence: float,
+        sparse: bool = False) -> "np.ndarray | scipy.sparse.csr_matrix":
     """
     Returns the transition matrix with one silence state and two states
     (onset and sustain) for each note. This matrix mixes an acoustic model with two states with
@@ -25,46 +118,433 @@ def transition_matrix(
         Probability of a sustain state returning to itself.
     p_stay_silence : float, between 0 and 1
         Probability of the silence state returning to itselt.
+    sparse : bool
+        If True, returns a scipy.sparse.csr_matrix holding only the non-zero
+        transitions: N_notes+1 in the silence row, 1 in each onset row and
+        N_notes+2 in each sustain row.
 
     Returns
     -------
-    transmat : np.array (2*N_notes+1x2*N_notes+1)
+    transmat : np.array or scipy.sparse.csr_matrix (2*N_notes+1x2*N_notes+1)
         Trasition matrix in which t[i,j] is the probability of
         going from state i to state j
 
     """
 
-    midi_min = librosa.note_to_midi(note_min)
-    midi_max = librosa.note_to_midi(note_max)
-    n_notes = midi_max - midi_min + 1
-    p_l = (1 - p_stay_silence) / n_notes
-    p_ll = (1 - p_stay_note) / (n_notes + 1)
+    _, n_notes, _, _ = _note_range(note_min, note_max)
+    p_l, p_ll = _transition_probabilities(n_notes, p_stay_note, p_stay_silence)
 
     # Transition matrix:
     # State 0 = silence
     # States 1, 3, 5... = onsets
     # States 2, 4, 6... = sustains
-    transmat = np.zeros((2 * n_notes + 1, 2 * n_notes + 1))
+    if sparse:
+        return _sparse_transition_matrix(n_notes, p_stay_note, p_stay_silence)
+
+    transmat = np.zeros((2 * n_notes + 1, 2 * n_notes + 1), dtype=np.float32)
 
     # State 0: silence
     transmat[0, 0] = p_stay_silence
-    for i in range(n_notes):
-        transmat[0, (i * 2) + 1] = p_l
+    transmat[0, 1::2] = p_l
 
     # States 1, 3, 5... = onsets
-    for i in range(n_notes):
-        transmat[(i * 2) + 1, (i * 2) + 2] = 1
+    onsets = np.arange(1, 2 * n_notes + 1, 2)
+    transmat[onsets, onsets + 1] = 1
 
     # States 2, 4, 6... = sustains
-    for i in range(n_notes):
-        transmat[(i * 2) + 2, 0] = p_ll
-        transmat[(i * 2) + 2, (i * 2) + 2] = p_stay_note
-        for j in range(n_notes):
-            transmat[(i * 2) + 2, (j * 2) + 1] = p_ll
+    transmat[2::2, 0] = p_ll
+    transmat[2::2, 1::2] = p_ll
+    np.fill_diagonal(transmat[2::2, 2::2], p_stay_note)
 
     return transmat
 
 
+def _n_frames(
+        n_samples: int,
+        frame_length: int,
+        hop_length: int,
+        center: bool) -> int:
+    """
+    Returns the number of frames of a signal with n_samples samples, as
+    counted by librosa. Without centering, a signal shorter than a frame
+    has no frames.
+    """
+    if center:
+        return 1 + n_samples // hop_length
+    return max(0, 1 + (n_samples - frame_length) // hop_length)
+
+
+def _estimate_f0(
+        audio_signal: np.array,
+        fmin: float,
+        fmax: float,
+        srate: int,
+        frame_length: int,
+        hop_length: int,
+        center: bool,
+        backend: str) -> tuple:
+    """
+    Estimates the fundamental frequency (Hz, NaN if unvoiced) and voicing of
+    each frame with the chosen backend:
+
+    - "pyin": librosa.pyin (default).
+    - "pyworld": WORLD's DIO + StoneMask, much faster on CPU. Requires the
+      optional pyworld package.
+    - "torchcrepe": the CREPE neural network, on GPU when available.
+      Requires the optional torchcrepe package.
+    """
+    if backend == "pyin":
+        pitch, voiced_flag, _ = librosa.pyin(
+            y=audio_signal, fmin=fmin, fmax=fmax,
+            sr=srate, frame_length=frame_length,
+            win_length=int(frame_length / 2),
+            hop_length=hop_length, center=center)
+        return pitch, voiced_flag
+
+    if backend == "pyworld":
+        try:
+            import pyworld
+        except ImportError as error:
+            raise ImportError(
+                "pitch_backend='pyworld' requires pyworld: pip install pyworld"
+            ) from error
+
+        audio_signal = audio_signal.astype(np.float64)
+        pitch, times = pyworld.dio(
+            audio_signal, srate, f0_floor=fmin, f0_ceil=fmax,
+            frame_period=hop_length / srate * 1000)
+        pitch = pyworld.stonemask(audio_signal, pitch, times, srate)
+        if not center:
+            # DIO frames are centered at t * hop_length
+            pitch = pitch[frame_length // (2 * hop_length):]
+
+    elif backend == "torchcrepe":
+        try:
+            import torch
+            import torchcrepe
+        except ImportError as error:
+            raise ImportError(
+                "pitch_backend='torchcrepe' requires torchcrepe: "
+                "pip install torchcrepe"
+            ) from error
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        pitch, periodicity = torchcrepe.predict(
+            torch.from_numpy(audio_signal.astype(np.float32))[None, :],
+            srate, hop_length=hop_length, fmin=fmin, fmax=fmax,
+            return_periodicity=True, device=device, pad=center)
+        pitch = pitch[0].cpu().numpy()
+        periodicity = periodicity[0].cpu().numpy()
+
+        # CREPE resamples to torchcrepe.SAMPLE_RATE and rounds the hop down
+        # to whole samples there, so its frames drift from t * hop_length.
+        # Both tracks are interpolated back onto the requested frame centers.
+        crepe_hop = int(hop_length * torchcrepe.SAMPLE_RATE / srate)
+        crepe_times = np.arange(len(pitch)) * crepe_hop / torchcrepe.SAMPLE_RATE
+        n_frames = _n_frames(
+            len(audio_signal), frame_length, hop_length, center)
+        times = np.arange(n_frames) * hop_length / srate
+        if not center:
+            # Uncentered frames start at these times
+            crepe_times += torchcrepe.WINDOW_SIZE / (2 * torchcrepe.SAMPLE_RATE)
+            times += frame_length / (2 * srate)
+        pitch = np.interp(times, crepe_times, pitch)
+        periodicity = np.interp(times, crepe_times, periodicity)
+
+        # Same voicing threshold as the torchcrepe documentation
+        pitch[periodicity < 0.21] = 0
+
+    else:
+        raise ValueError(
+            "pitch_backend must be 'pyin', 'pyworld' or 'torchcrepe', "
+            f"got {backend!r}")
+
+    voiced_flag = pitch > 0
+    return np.where(voiced_flag, pitch, np.nan), voiced_flag
+
+
+def _downsample(
+        audio_signal: np.array,
+        srate: float,
+        frame_length: int,
+        hop_length: int,
+        target_srate: float) -> tuple:
+    """
+    Resamples a signal to about target_srate, if it is sampled above that.
+
+    The hop is scaled to a whole number of samples first, and the rate is
+    then chosen so that it still spans hop_length / srate seconds. Frames
+    of the resampled signal stay on the original time grid, for any ratio.
+
+    Returns the (possibly) resampled signal with its sample rate,
+    frame_length and hop_length.
+    """
+    if srate <= target_srate:
+        return audio_signal, srate, frame_length, hop_length
+
+    new_hop_length = int(np.ceil(hop_length * target_srate / srate))
+    ratio = new_hop_length / hop_length
+    new_srate = srate * ratio
+    audio_signal = librosa.resample(
+        audio_signal, orig_sr=srate, target_sr=new_srate)
+    return (
+        audio_signal, new_srate,
+        int(round(frame_length * ratio)), new_hop_length)
+
+
+def _frame_features(
+        audio_signal: np.array,
+        fmin: float,
+        fmax: float,
+        srate: int,
+        frame_length: int,
+        hop_length: int,
+        center: bool = True,
+        pitch_backend: str = "pyin") -> tuple:
+    """
+    Runs the frame-level analysis of an audio signal.
+
+    Signals sampled above _ANALYSIS_SRATE are downsampled first, and pitch
+    is estimated at max(_PITCH_MIN_SRATE, 4 * fmax) if that is lower, with
+    frame_length and hop_length scaled accordingly. The results are then
+    fitted to the frame count of the original frame_length/hop_length grid,
+    so that frame t still corresponds to time t * hop_length / srate.
+
+    Returns
+    -------
+    pitch : 1-D numpy array
+        Fundamental frequency (Hz) for each frame, NaN if unvoiced.
+    voiced_flag : 1-D numpy array of bool
+        Whether each frame is voiced.
+    onset_env : 1-D numpy array
+        Onset strength envelope for each frame.
+    """
+    n_frames = _n_frames(len(audio_signal), frame_length, hop_length, center)
+    if n_frames == 0:
+        # Too short for a single uncentered frame
+        return np.zeros(0), np.zeros(0, dtype=bool), np.zeros(0)
+
+    audio_signal, srate, frame_length, hop_length = _downsample(
+        audio_signal, srate, frame_length, hop_length, _ANALYSIS_SRATE)
+
+    # pitch and voicing, at a lower rate still if the note range allows it
+    pitch_signal, pitch_srate, pitch_frame_length, pitch_hop_length = \
+        _downsample(audio_signal, srate, frame_length, hop_length,
+                    max(_PITCH_MIN_SRATE, 4 * fmax * 1.1))
+    pitch, voiced_flag = _estimate_f0(
+        pitch_signal, fmin * 0.9, fmax * 1.1, pitch_srate,
+        pitch_frame_length, pitch_hop_length, center, pitch_backend)
+
+    # onset strength, from a power spectrogram on the same frame grid
+    spectrogram = np.abs(librosa.stft(
+        audio_signal, n_fft=frame_length, hop_length=hop_length,
+        center=center)) ** 2
+    onset_env = librosa.onset.onset_strength(
+        S=librosa.power_to_db(
+            librosa.feature.melspectrogram(S=spectrogram, sr=srate)),
+        sr=srate, n_fft=frame_length, hop_length=hop_length, center=center)
+
+    return (
+        librosa.util.fix_length(pitch, size=n_frames, mode="edge"),
+        librosa.util.fix_length(voiced_flag, size=n_frames, mode="edge"),
+        librosa.util.fix_length(onset_env, size=n_frames, mode="edge"))
+
+
+def _stream_features(
+        blocks,
+        fmin: float,
+        fmax: float,
+        srate: int,
+        frame_length: int,
+        hop_length: int,
+        pitch_backend: str = "pyin") -> tuple:
+    """
+    Runs _frame_features() over blocks of audio, as generated by
+    librosa.stream() with the same frame_length and hop_length, and
+    joins the results. Only one block is kept in memory at a time.
+    """
+    # Blocks are analyzed without centering, so frame t starts at sample
+    # t * hop_length. Leading unvoiced frames put frame centers back on
+    # the same grid as the centered analysis of a whole signal.
+    n_pad = frame_length // (2 * hop_length)
+    pitch = [np.full(n_pad, np.nan)]
+    voiced_flag = [np.zeros(n_pad, dtype=bool)]
+    onset_env = [np.zeros(n_pad)]
+    for block in blocks:
+        if len(block) < frame_length:
+            # Too short to hold a single frame (end of stream)
+            continue
+        block_features = _frame_features(
+            block, fmin, fmax, srate, frame_length, hop_length,
+            center=False, pitch_backend=pitch_backend)
+        pitch.append(block_features[0])
+        voiced_flag.append(block_features[1])
+        onset_env.append(block_features[2])
+
+    return (
+        np.concatenate(pitch),
+        np.concatenate(voiced_flag),
+        np.concatenate(onset_env))
+
+
+@numba.njit(cache=True, parallel=True, fastmath=True)
+def _build_log_priors(
+        f0_: np.array,
+        voiced_flag: np.array,
+        onset_mask: np.array,
+        midi_min: int,
+        n_notes: int,
+        pitch_acc: float,
+        voiced_acc: float,
+        onset_acc: float,
+        spread: float) -> np.array:
+    """
+    Fills the log-prior matrix returned by prior_probabilities(log=True)
+    from the rounded MIDI pitch, voicing and onset of each frame. Frames
+    are independent, so they are split among threads.
+
+    The matrix is column-major (Fortran order): all states of one frame are
+    contiguous, which is how both this kernel and the Viterbi decoder walk it.
+    """
+    log_voiced = _log(voiced_acc)
+    log_unvoiced = _log(1 - voiced_acc)
+    log_onset = _log(onset_acc)
+    log_no_onset = _log(1 - onset_acc)
+    log_pitch = _log(pitch_acc)
+    log_spread = _log(pitch_acc * spread)
+    log_no_pitch = _log(1 - pitch_acc)
+
+    log_priors = np.empty((len(f0_), n_notes * 2 + 1), dtype=np.float32).T
+    for t in numba.prange(len(f0_)):
+        # probability of silence or onset = 1-voiced_prob
+        # Probability of a note = voiced_prob * (pitch_acc) (estimated note)
+        # Probability of a note = voiced_prob * (1-pitch_acc) (estimated note)
+        if voiced_flag[t]:
+            log_priors[0, t] = log_unvoiced
+        else:
+            log_priors[0, t] = log_voiced
+
+        if onset_mask[t]:
+            log_p_onset = log_onset
+        else:
+            log_p_onset = log_no_onset
+
+        for j in range(n_notes):
+            # Onset states share the same observation for every note
+            log_priors[(j * 2) + 1, t] = log_p_onset
+
+            # Sustain states depend on the distance (in semitones) to the
+            # estimated f0
+            diff = abs(j + midi_min - f0_[t])
+            if diff == 0:
+                log_priors[(j * 2) + 2, t] = log_pitch
+            elif diff == 1:
+                log_priors[(j * 2) + 2, t] = log_spread
+            else:
+                log_priors[(j * 2) + 2, t] = log_no_pitch
+
+    return log_priors
+
+
+def _frame_observations(
+        pitch: np.array,
+        onset_env: np.array,
+        srate: int,
+        hop_length: int,
+        tuning: float = None) -> tuple:
+    """
+    Turns the pitch track and onset envelope from _frame_features() into
+    the rounded MIDI pitch of each frame and the (sorted) onset frames.
+    The tuning deviation is estimated from the pitch track unless it is
+    given.
+    """
+    if tuning is None:
+        if np.any(np.isfinite(pitch)):
+            tuning = librosa.pitch_tuning(pitch)
+        else:
+            # Nothing is voiced, so there is nothing to tune against
+            tuning = 0.0
+    # Unvoiced frames (NaN pitch) get a MIDI number far from any note, so
+    # they fall in the 1-pitch_acc case for every sustain state
+    f0_hz = pitch - tuning
+    valid = np.isfinite(f0_hz)
+    f0_ = np.where(
+        valid, librosa.hz_to_midi(np.where(valid, f0_hz, 1.0)), -999
+    ).round().astype(np.int16)
+    if len(onset_env) > 0:
+        onsets = librosa.onset.onset_detect(
+            onset_envelope=onset_env, sr=srate,
+            hop_length=hop_length, backtrack=True)
+    else:
+        onsets = np.zeros(0, dtype=int)
+
+    return f0_, onsets
+
+
+def _features_to_log_priors(
+        pitch: np.array,
+        voiced_flag: np.array,
+        onset_env: np.array,
+        midi_min: int,
+        n_notes: int,
+        srate: int,
+        hop_length: int,
+        pitch_acc: float,
+        voiced_acc: float,
+        onset_acc: float,
+        spread: float,
+        tuning: float = None) -> np.array:
+    """
+    Turns the output of _frame_features() into the log-priors returned by
+    prior_probabilities(log=True).
+    """
+    f0_, onsets = _frame_observations(
+        pitch, onset_env, srate, hop_length, tuning)
+
+    onset_mask = np.zeros(len(pitch), dtype=bool)
+    onset_mask[onsets] = True
+
+    return _build_log_priors(
+        f0_, voiced_flag, onset_mask, midi_min, n_notes,
+        pitch_acc, voiced_acc, onset_acc, spread)
+
+
+def _iter_features_log_priors(
+        pitch: np.array,
+        voiced_flag: np.array,
+        onset_env: np.array,
+        midi_min: int,
+        n_notes: int,
+        srate: int,
+        hop_length: int,
+        pitch_acc: float,
+        voiced_acc: float,
+        onset_acc: float,
+        spread: float,
+        tuning: float = None,
+        block_length: int = 1024):
+    """
+    Same as _features_to_log_priors(), but yields the log-priors in
+    (log_priors_block, t0) pairs of at most block_length frames.
+    """
+    f0_, onsets = _frame_observations(
+        pitch, onset_env, srate, hop_length, tuning)
+
+    # Onsets are sparse and sorted, so each block only gets a mask of its
+    # own frames, from the onsets found between its bounds
+    bounds = np.searchsorted(
+        onsets, np.arange(0, len(pitch) + block_length, block_length))
+    onset_mask = np.empty(block_length, dtype=bool)
+
+    for block, t0 in enumerate(range(0, len(pitch), block_length)):
+        t1 = min(t0 + block_length, len(pitch))
+        onset_mask[:] = False
+        onset_mask[onsets[bounds[block]:bounds[block + 1]] - t0] = True
+        yield _build_log_priors(
+            f0_[t0:t1], voiced_flag[t0:t1], onset_mask[:t1 - t0], midi_min,
+            n_notes, pitch_acc, voiced_acc, onset_acc, spread), t0
+
+
 def prior_probabilities(
         audio_signal: np.array,
         note_min: str,
@@ -75,7 +555,11 @@ def prior_probabilities(
         pitch_acc: float = 0.9,
         voiced_acc: float = 0.9,
         onset_acc: float = 0.9,
-        spread: float = 0.2) -> np.array:
+        spread: float = 0.2,
+        center: bool = True,
+        pitch_backend: str = "pyin",
+        tuning: float = None,
+        log: bool = False) -> np.array:
     """
     Estimate prior (observed) probabilities from audio signal
 
@@ -103,133 +587,295 @@ def prior_probabilities(
     spread : float, between 0 and 1
         Probability that the singer/musician had a one-semitone deviation
         due to vibrato or glissando.
+    center : bool
+        If True, frame t is centered at sample t * hop_length (the signal is
+        padded at both ends). If False, frame t starts at that sample, and
+        pyin and the onset spectrogram skip the padding.
+    pitch_backend : string
+        Pitch estimator: "pyin" (default), "pyworld" (faster, requires
+        pyworld) or "torchcrepe" (uses the GPU if available, requires
+        torchcrepe).
+    tuning : float or None
+        Tuning deviation in fractions of a bin, as returned by
+        librosa.pitch_tuning(). If None, it is estimated from the signal;
+        passing a known value skips that estimation.
+    log : bool
+        If True, returns natural log-probabilities instead, as used by the
+        Viterbi decoder. This skips the conversion back to probabilities.
 
     Returns
     -------
-    priors : 2D numpy array.
-        priors[j,t] is the prior probability of being in state j at time t.
+    priors : 2D numpy array of float32.
+        priors[j,t] is the prior probability (or its log, if log=True) of
+        being in state j at time t.
 
     """
+    midi_min, n_notes, fmin, fmax = _note_range(note_min, note_max)
 
-    fmin = librosa.note_to_hz(note_min)
-    fmax = librosa.note_to_hz(note_max)
-    midi_min = librosa.note_to_midi(note_min)
-    midi_max = librosa.note_to_midi(note_max)
-    n_notes = midi_max - midi_min + 1
-
-    # pitch and voicing
-    pitch, voiced_flag, _ = librosa.pyin(
-        y=audio_signal, fmin=fmin * 0.9, fmax=fmax * 1.1,
-        sr=srate, frame_length=frame_length, win_length=int(frame_length / 2),
-        hop_length=hop_length)
-    tuning = librosa.pitch_tuning(pitch)
-    f0_ = np.round(librosa.hz_to_midi(pitch - tuning)).astype(int)
-    onsets = librosa.onset.onset_detect(
-        y=audio_signal, sr=srate,
-        hop_length=hop_length, backtrack=True)
-
-    priors = np.ones((n_notes * 2 + 1, len(pitch)))
-
-    for n_frame in range(len(pitch)):
-        # probability of silence or onset = 1-voiced_prob
-        # Probability of a note = voiced_prob * (pitch_acc) (estimated note)
-        # Probability of a note = voiced_prob * (1-pitch_acc) (estimated note)
-        if not voiced_flag[n_frame]:
-            priors[0, n_frame] = voiced_acc
-        else:
-            priors[0, n_frame] = 1 - voiced_acc
+    pitch, voiced_flag, onset_env = _frame_features(
+        audio_signal, fmin, fmax, srate, frame_length, hop_length,
+        center=center, pitch_backend=pitch_backend)
 
-        for j in range(n_notes):
-            if n_frame in onsets:
-                priors[(j * 2) + 1, n_frame] = onset_acc
-            else:
-                priors[(j * 2) + 1, n_frame] = 1 - onset_acc
+    log_priors = _features_to_log_priors(
+        pitch, voiced_flag, onset_env, midi_min, n_notes, srate,
+        hop_length, pitch_acc, voiced_acc, onset_acc, spread, tuning)
 
-            if j + midi_min == f0_[n_frame]:
-                priors[(j * 2) + 2, n_frame] = pitch_acc
+    if log:
+        return log_priors
+    return np.exp(log_priors)
 
-            elif np.abs(j + midi_min - f0_[n_frame]) == 1:
-                priors[(j * 2) + 2, n_frame] = pitch_acc * spread
 
-            else:
-                priors[(j * 2) + 2, n_frame] = 1 - pitch_acc
+def iter_prior_probabilities(
+        audio_signal: np.array,
+        note_min: str,
+        note_max: str,
+        srate: int,
+        frame_length: int = 2048,
+        hop_length: int = 512,
+        pitch_acc: float = 0.9,
+        voiced_acc: float = 0.9,
+        onset_acc: float = 0.9,
+        spread: float = 0.2,
+        center: bool = True,
+        pitch_backend: str = "pyin",
+        tuning: float = None,
+        block_length: int = 1024,
+        log: bool = False):
+    """
+    Estimate prior (observed) probabilities from audio signal, in blocks
+    of frames
+
+    Gives the same priors as prior_probabilities(), without building
+    the whole matrix: each block is filled when it is requested. Pitch,
+    voicing and onsets are still analyzed over the whole signal first.
 
-    return priors
+    Parameters
+    ----------
+    audio_signal, note_min, note_max, srate, frame_length, hop_length,
+    pitch_acc, voiced_acc, onset_acc, spread, center, pitch_backend, tuning
+        As in prior_probabilities().
+    block_length : int
+        Number of frames in each block (the last one may be shorter).
+    log : bool
+        As in prior_probabilities().
 
+    Yields
+    ------
+    priors_block : 2D numpy array of float32.
+        priors_block[j,t] is the prior probability (or its log, if
+        log=True) of being in state j at time t0+t.
+    t0 : int
+        Index of the first frame in the block.
 
-def states_to_pianoroll(states: list, note_min: str, hop_time: float) -> list:
     """
-    Converts state sequence to an intermediate, internal piano-roll notation
+    midi_min, n_notes, fmin, fmax = _note_range(note_min, note_max)
+
+    pitch, voiced_flag, onset_env = _frame_features(
+        audio_signal, fmin, fmax, srate, frame_length, hop_length,
+        center=center, pitch_backend=pitch_backend)
+
+    for log_priors_block, t0 in _iter_features_log_priors(
+            pitch, voiced_flag, onset_env, midi_min, n_notes, srate,
+            hop_length, pitch_acc, voiced_acc, onset_acc, spread, tuning,
+            block_length):
+        if log:
+            yield log_priors_block, t0
+        else:
+            yield np.exp(log_priors_block), t0
+
+
+@numba.njit(cache=True)
+def _scan_states(states: np.array, midi_min: int, hop_time: float) -> tuple:
+    """
+    Walks the state sequence and finds the notes in it. This is the
+    numerical core of states_to_pianoroll().
 
     Parameters
     ----------
-    states : list of int (or other iterable)
+    states : 1-D numpy array of int32
         Sequence of states estimated by Viterbi
-    note_min : string, 'A#4' format
-        Lowest note supported by this estimator
+    midi_min : int
+        MIDI number of the lowest note supported by this estimator
     hop_time : float
         Time interval between two states.
 
     Returns
     -------
-    output : List of lists
-        output[i] is the i-th note in the sequence. Each note is a list
-        described by [onset_time, offset_time, pitch, note_name], e.g., output[1][0]
-        is the onset time for the second note.
+    onsets, offsets, midis : 1-D numpy arrays
+        Onset time, offset time and MIDI pitch of each note found.
     """
-    midi_min = librosa.note_to_midi(note_min)
-
-    states_ = np.hstack((states, np.zeros(1)))
-
     # possible types of states
     silence = 0
     onset = 1
     sustain = 2
 
-    my_state = silence
-    output = []
+    # Each note lasts at least two states (onset and sustain)
+    max_notes = len(states) // 2 + 1
+    onsets = np.empty(max_notes, dtype=np.float64)
+    offsets = np.empty(max_notes, dtype=np.float64)
+    midis = np.empty(max_notes, dtype=np.int16)
+    n_written = 0
 
-    last_onset = 0
-    last_offset = 0
+    my_state = silence
+    last_onset = 0.0
     last_midi = 0
-    for i, _ in enumerate(states_):
+    for i in range(len(states)):
         if my_state == silence:
-            if int(states_[i] % 2) != 0:
+            if states[i] & 1:
                 # Found an onset!
                 last_onset = i * hop_time
-                last_midi = ((states_[i] - 1) / 2) + midi_min
-                last_note = librosa.midi_to_note(last_midi)
+                last_midi = (states[i] >> 1) + midi_min
                 my_state = onset
 
         elif my_state == onset:
-            if int(states_[i] % 2) == 0:
+            if not states[i] & 1:
                 my_state = sustain
 
         elif my_state == sustain:
-            if int(states_[i] % 2) != 0:
+            if states[i] & 1:
                 # Found an onset.
                 # Finish last note
-                last_offset = i * hop_time
-                my_note = [last_onset, last_offset, last_midi, last_note]
-                output.append(my_note)
+                onsets[n_written] = last_onset
+                offsets[n_written] = i * hop_time
+                midis[n_written] = last_midi
+                n_written += 1
 
                 # Start new note
                 last_onset = i * hop_time
-                last_midi = ((states_[i] - 1) / 2) + midi_min
-                last_note = librosa.midi_to_note(last_midi)
+                last_midi = (states[i] >> 1) + midi_min
                 my_state = onset
 
-            elif states_[i] == 0:
+            elif states[i] == 0:
                 # Found silence. Finish last note.
-                last_offset = i * hop_time
-                my_note = [last_onset, last_offset, last_midi, last_note]
-                output.append(my_note)
+                onsets[n_written] = last_onset
+                offsets[n_written] = i * hop_time
+                midis[n_written] = last_midi
+                n_written += 1
                 my_state = silence
 
+    if my_state == sustain:
+        # Sequence ended during a note. Finish it.
+        onsets[n_written] = last_onset
+        offsets[n_written] = len(states) * hop_time
+        midis[n_written] = last_midi
+        n_written += 1
+
+    return onsets[:n_written], offsets[:n_written], midis[:n_written]
+
+
+def _note_name(midi: int) -> str:
+    """
+    Returns the name of a MIDI note number, from _MIDI_TO_NOTE when it is
+    in the table.
+    """
+    if 0 <= midi < len(_MIDI_TO_NOTE):
+        return _MIDI_TO_NOTE[midi]
+    return librosa.midi_to_note(midi)
+
+
+def states_to_pianoroll(states: list, note_min: str, hop_time: float) -> list:
+    """
+    Converts state sequence to an intermediate, internal piano-roll notation
+
+    Parameters
+    ----------
+    states : list of int (or other iterable)
+        Sequence of states estimated by Viterbi
+    note_min : string, 'A#4' format
+        Lowest note supported by this estimator
+    hop_time : float
+        Time interval between two states.
+
+    Returns
+    -------
+    output : List of lists
+        output[i] is the i-th note in the sequence. Each note is a list
+        described by [onset_time, offset_time, pitch, note_name], e.g., output[1][0]
+        is the onset time for the second note.
+    """
+    midi_min = librosa.note_to_midi(note_min)
+
+    states_ = np.asarray(states, dtype=np.int32)
+
+    onsets, offsets, midis = _scan_states(states_, midi_min, hop_time)
+
+    output = [
+        [onset_time, offset_time, midi, _note_name(midi)]
+        for onset_time, offset_time, midi in zip(
+            onsets.tolist(), offsets.tolist(), midis.tolist())]
+
     return output
 
 
-def pianoroll_to_midi(bpm: float, pianoroll: list) -> midiutil.MIDIFile():
+def _pianoroll_to_notes(pianoroll: list) -> tuple:
+    """
+    Splits a pianoroll list, as estimated by states_to_pianoroll(), into
+    arrays of onset times, offset times and MIDI pitches.
+    """
+    onsets = np.array([p[0] for p in pianoroll], dtype=np.float64)
+    offsets = np.array([p[1] for p in pianoroll], dtype=np.float64)
+    pitches = np.array([p[2] for p in pianoroll], dtype=np.int64)
+    return onsets, offsets, pitches
+
+
+def _notes_to_midi(
+        bpm: float,
+        onsets: np.array,
+        offsets: np.array,
+        pitches: np.array) -> midiutil.MIDIFile:
+    """
+    Builds a MIDI file from arrays of onset times, offset times and MIDI
+    pitches. See pianoroll_to_midi().
+    """
+    quarter_note = 60 / bpm
+
+    starts = onsets / quarter_note
+    durations = (offsets - onsets) / quarter_note
+
+    midi = midiutil.MIDIFile(1)
+    midi.addTempo(0, 0, bpm)
+
+    for start, duration, pitch in zip(
+            starts.tolist(), durations.tolist(), pitches.tolist()):
+        midi.addNote(0, 0, pitch, start, duration, 100)
+
+    return midi
+
+
+def _notes_to_score(
+        bpm: float,
+        onsets: np.array,
+        offsets: np.array,
+        pitches: np.array,
+        tpq: int = 960) -> "symusic.Score":
+    """
+    Builds a symusic Score from arrays of onset times, offset times and MIDI
+    pitches. See pianoroll_to_score().
+    """
+    try:
+        import symusic
+    except ImportError as error:
+        raise ImportError(
+            "pianoroll_to_score requires symusic: pip install symusic"
+        ) from error
+
+    quarter_note = 60 / bpm
+
+    starts = np.round(onsets / quarter_note * tpq).astype(np.int32)
+    durations = np.round((offsets - onsets) / quarter_note * tpq).astype(np.int32)
+    velocities = np.full(len(pitches), 100, dtype=np.int8)
+
+    score = symusic.Score(tpq)
+    score.tempos.append(symusic.Tempo(0, bpm))
+    track = symusic.Track()
+    track.notes = symusic.Note.from_numpy(
+        starts, durations, pitches.astype(np.int8), velocities)
+    score.tracks.append(track)
+
+    return score
+
+
+def pianoroll_to_midi(bpm: float, pianoroll: list) -> midiutil.MIDIFile:
     """
     Converts an internal piano roll notation to a MIDI file
 
@@ -247,23 +893,37 @@ def pianoroll_to_midi(bpm: float, pianoroll: list) -> midiutil.MIDIFile():
     None.
 
     """
-    quarter_note = 60 / bpm
+    return _notes_to_midi(bpm, *_pianoroll_to_notes(pianoroll))
 
-    onsets = np.array([p[0] for p in pianoroll])
-    offsets = np.array([p[1] for p in pianoroll])
 
-    onsets = onsets / quarter_note
-    offsets = offsets / quarter_note
-    durations = offsets - onsets
+def pianoroll_to_score(
+        bpm: float,
+        pianoroll: list,
+        tpq: int = 960) -> "symusic.Score":
+    """
+    Converts an internal piano roll notation to a symusic Score. This is a
+    faster alternative to pianoroll_to_midi(), as all notes are handed to
+    symusic's C++ backend at once. Requires the optional symusic package.
 
-    midi = midiutil.MIDIFile(1)
-    midi.addTempo(0, 0, bpm)
+    Parameters
+    ----------
+    bpm: float
+        Beats per minute for the MIDI file. If necessary, use
+        bpm = librosa.beat.tempo(y)[0] to estimate bpm.
 
-    for i, _ in enumerate(onsets):
-        midi.addNote(
-            0, 0, int(pianoroll[i][2]), onsets[i], durations[i], 100)
+    pianoroll : list
+        A pianoroll list as estimated by states_to_pianoroll().
 
-    return midi
+    tpq : int
+        Ticks per quarter note.
+
+    Returns
+    -------
+    score : symusic.Score
+        A score that can be written to disk with score.dump_midi(path).
+
+    """
+    return _notes_to_score(bpm, *_pianoroll_to_notes(pianoroll), tpq=tpq)
 
 
 def wave_to_midi(
@@ -278,12 +938,21 @@ def wave_to_midi(
         pitch_acc: float = 0.9,
         voiced_acc: float = 0.9,
         onset_acc: float = 0.9,
-        spread: float = 0.2) -> midiutil.MIDIFile():
+        spread: float = 0.2,
+        midi_backend: str = "midiutil",
+        pitch_backend: str = "pyin",
+        tuning: float = None) -> "midiutil.MIDIFile | symusic.Score":
     """Converts an audio signal to a MIDI file
 
     Args:
-        audio_signal (np.array): Array containing audio samples
+        audio_signal (np.array): Array containing audio samples, or an iterable of
+                                                 blocks of samples as generated by
+                                                 librosa.stream() with the same
+                                                 frame_length and hop_length.
         srate (int, optional): Sample rate of the audio signal Defaults to 22050.
+                                                 Higher rates are downsampled to 22050
+                                                 for analysis; note timing still follows
+                                                 hop_length / srate.
         frame_length (int, optional): Frame length for analysis. Defaults to 2048.
         hop_length (int, optional): Hop between two frames in analysis. Defaults to 512.
         note_min (str, optional): Lowest allowed note in "A#4" format. Defaults to "A2".
@@ -299,28 +968,75 @@ def wave_to_midi(
         onset_acc (float, optional): Estimated accuracy of the onset detector. Defaults to 0.9.
         spread (float, optional): Probability that the audio signal deviates by one semitone
                                                  due to vibrato or glissando. Defaults to 0.2.
+        midi_backend (str, optional): Library used to build the MIDI file, either
+                                                 "midiutil" or "symusic" (faster, optional
+                                                 dependency). Defaults to "midiutil".
+        pitch_backend (str, optional): Pitch estimator, either "pyin", "pyworld"
+                                                 (faster, optional dependency) or
+                                                 "torchcrepe" (GPU if available, optional
+                                                 dependency). Defaults to "pyin".
+        tuning (float, optional): Tuning deviation as returned by
+                                                 librosa.pitch_tuning(). Estimated once
+                                                 over the whole signal (or all blocks)
+                                                 if None. Defaults to None.
 
     Returns:
-        midi (midiutil.MIDIFile): A MIDI file that can be written to disk.
+        midi (midiutil.MIDIFile or symusic.Score): A MIDI file that can be written
+                                                 to disk with midi.writeFile(file)
+                                                 (midiutil) or midi.dump_midi(path)
+                                                 (symusic).
     """
-    transmat = transition_matrix(note_min, note_max, p_stay_note, p_stay_silence)
-    priors = prior_probabilities(
-        audio_signal,
-        note_min,
-        note_max,
+    if midi_backend not in ("midiutil", "symusic"):
+        raise ValueError(
+            f"midi_backend must be 'midiutil' or 'symusic', got {midi_backend!r}")
+
+    # Note names are parsed once, everything below works on numbers
+    midi_min, n_notes, fmin, fmax = _note_range(note_min, note_max)
+
+    if isinstance(audio_signal, np.ndarray):
+        pitch, voiced_flag, onset_env = _frame_features(
+            audio_signal, fmin, fmax, srate, frame_length, hop_length,
+            pitch_backend=pitch_backend)
+    else:
+        pitch, voiced_flag, onset_env = _stream_features(
+            audio_signal, fmin, fmax, srate, frame_length, hop_length,
+            pitch_backend=pitch_backend)
+
+    # The onset envelope is shared with tempo estimation
+    bpm = librosa.beat.tempo(
+        onset_envelope=onset_env, sr=srate, hop_length=hop_length)[0]
+
+    # The log-priors are filled and decoded one block of frames at a time
+    log_priors = _iter_features_log_priors(
+        pitch,
+        voiced_flag,
+        onset_env,
+        midi_min,
+        n_notes,
         srate,
-        frame_length,
         hop_length,
         pitch_acc,
         voiced_acc,
         onset_acc,
-        spread)
-    p_init = np.zeros(transmat.shape[0])
+        spread,
+        tuning)
+    p_l, p_ll = _transition_probabilities(n_notes, p_stay_note, p_stay_silence)
+    p_init = np.zeros(n_notes * 2 + 1)
     p_init[0] = 1
-    states = librosa.sequence.viterbi(priors, transmat, p_init=p_init)
 
-    pianoroll = states_to_pianoroll(states, note_min, hop_length / srate)
-    bpm = librosa.beat.tempo(y=audio_signal)[0]
-    midi = pianoroll_to_midi(bpm, pianoroll)
+    states = viterbi_sparse_blocks(
+        log_priors,
+        _log(p_init),
+        _log(p_stay_silence),
+        _log(p_l),
+        _log(p_stay_note),
+        _log(p_ll))
+
+    # Notes are kept as arrays (onsets, offsets, pitches) from here on
+    notes = _scan_states(states, midi_min, hop_length / srate)
+    if midi_backend == "symusic":
+        midi = _notes_to_score(bpm, *notes)
+    else:
+        midi = _notes_to_midi(bpm, *notes)
 
     return midi
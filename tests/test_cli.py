@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import numpy as np
+import librosa
+import soundfile as sf
+
+from sound_to_midi import cli
+
+
+def _write_melody(path, srate=22050):
+    parts = []
+    for note in ["A3", "C4", "E4"]:
+        parts.append(librosa.tone(
+            librosa.note_to_hz(note), sr=srate, duration=0.5))
+        parts.append(np.zeros(srate // 4))
+    sf.write(path, np.concatenate(parts), srate)
+
+
+def _run(monkeypatch, file_in, file_out):
+    """
+    Runs the CLI and returns the audio argument given to wave_to_midi.
+    """
+    inputs = []
+
+    def wave_to_midi(audio, **kwargs):
+        if not isinstance(audio, np.ndarray):
+            audio = list(audio)
+        inputs.append(audio)
+        return cli_wave_to_midi(audio, **kwargs)
+
+    cli_wave_to_midi = cli.wave_to_midi
+    # Several blocks, even for a short file
+    monkeypatch.setattr(cli, "BLOCK_LENGTH", 16)
+    monkeypatch.setattr(cli, "wave_to_midi", wave_to_midi)
+    monkeypatch.setattr(sys, "argv", ["w2m", str(file_in), str(file_out)])
+    cli.run()
+    return inputs[0]
+
+
+def test_cli_streams_soundfile_input(tmp_path, monkeypatch):
+    file_in = tmp_path / "melody.wav"
+    file_out = tmp_path / "melody.mid"
+    _write_melody(file_in)
+
+    audio = _run(monkeypatch, file_in, file_out)
+
+    assert isinstance(audio, list)
+    assert len(audio) > 1
+    assert file_out.stat().st_size > 0
+
+
+def test_cli_loads_input_soundfile_cannot_read(tmp_path, monkeypatch):
+    file_in = tmp_path / "melody.wav"
+    file_out = tmp_path / "melody.mid"
+    _write_melody(file_in)
+
+    class UnreadableSoundFile(sf.SoundFile):
+        def __init__(self, *args, **kwargs):
+            raise sf.SoundFileRuntimeError("Format not recognised.")
+
+    # librosa.load() then decodes the file through audioread
+    monkeypatch.setattr(sf, "SoundFile", UnreadableSoundFile)
+
+    audio = _run(monkeypatch, file_in, file_out)
+
+    assert isinstance(audio, np.ndarray)
+    assert file_out.stat().st_size > 0
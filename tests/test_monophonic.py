@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+import numpy as np
+import librosa
+import pytest
+import scipy.sparse
+
+from sound_to_midi.monophonic import (
+    _downsample, _frame_features, iter_prior_probabilities,
+    prior_probabilities, states_to_pianoroll, transition_matrix, wave_to_midi)
+
+
+def _melody(srate):
+    notes = ["A3", "C4", "E4", "A4"]
+    silence = np.zeros(srate // 4)
+    parts = []
+    for note in notes:
+        parts.append(librosa.tone(
+            librosa.note_to_hz(note), sr=srate, duration=0.5))
+        parts.append(silence)
+    return np.concatenate(parts).astype(np.float32)
+
+
+def test_states_to_pianoroll_note_names():
+    # One note per onset/sustain pair, in order, between silences
+    states = [0]
+    for j in range(4):
+        states += [(j * 2) + 1, (j * 2) + 2, 0]
+    for note_min in ["C-1", "A2", "G9", "G#9"]:
+        midi_min = librosa.note_to_midi(note_min)
+        pianoroll = states_to_pianoroll(states, note_min, 0.1)
+        assert [note[2] for note in pianoroll] == [
+            midi_min + j for j in range(4)]
+        assert [note[3] for note in pianoroll] == [
+            librosa.midi_to_note(midi_min + j) for j in range(4)]
+
+
+def _score_notes(score):
+    notes = score.tracks[0].notes.numpy()
+    return notes["time"], notes["duration"], notes["pitch"]
+
+
+def test_symusic_backend_matches_midiutil():
+    symusic = pytest.importorskip("symusic")
+    srate = 22050
+    audio_signal = _melody(srate)
+
+    midi = wave_to_midi(audio_signal, srate, midi_backend="midiutil")
+    score = wave_to_midi(audio_signal, srate, midi_backend="symusic")
+
+    midi_file = io.BytesIO()
+    midi.writeFile(midi_file)
+    expected = symusic.Score.from_midi(midi_file.getvalue())
+
+    assert isinstance(score, symusic.Score)
+    assert score.ticks_per_quarter == expected.ticks_per_quarter
+    times, durations, pitches = _score_notes(score)
+    expected_times, expected_durations, expected_pitches = \
+        _score_notes(expected)
+    assert len(pitches) > 0
+    np.testing.assert_array_equal(pitches, expected_pitches)
+    # midiutil truncates times to whole ticks, symusic rounds them
+    np.testing.assert_allclose(times, expected_times, atol=1)
+    np.testing.assert_allclose(durations, expected_durations, atol=1)
+
+
+def test_sparse_transition_matrix_matches_dense():
+    for note_min, note_max, p_stay_note, p_stay_silence in [
+            ("A2", "E5", 0.9, 0.7),
+            ("C4", "C4", 0.5, 0.5),
+            ("E3", "B3", 0.1, 0.95)]:
+        n_notes = librosa.note_to_midi(note_max) \
+            - librosa.note_to_midi(note_min) + 1
+        dense = transition_matrix(
+            note_min, note_max, p_stay_note, p_stay_silence)
+        sparse = transition_matrix(
+            note_min, note_max, p_stay_note, p_stay_silence, sparse=True)
+
+        assert isinstance(sparse, scipy.sparse.csr_matrix)
+        assert sparse.nnz == (n_notes + 1) + n_notes * (n_notes + 3)
+        np.testing.assert_array_equal(sparse.toarray(), dense)
+
+
+def test_iter_prior_probabilities_matches_prior_probabilities():
+    srate = 22050
+    audio_signal = _melody(srate)
+    for log in (False, True):
+        priors = prior_probabilities(
+            audio_signal, "A2", "E5", srate, log=log)
+        blocks = list(iter_prior_probabilities(
+            audio_signal, "A2", "E5", srate, block_length=37, log=log))
+
+        t0s = [t0 for _, t0 in blocks]
+        assert t0s == list(range(0, priors.shape[1], 37))
+        np.testing.assert_array_equal(
+            np.concatenate([block for block, _ in blocks], axis=1), priors)
+
+
+def _reference_states_to_pianoroll(states, note_min, hop_time):
+    """
+    The original, pure-Python states_to_pianoroll().
+    """
+    midi_min = librosa.note_to_midi(note_min)
+    states_ = np.hstack((states, np.zeros(1)))
+
+    silence = 0
+    onset = 1
+    sustain = 2
+
+    my_state = silence
+    output = []
+    last_onset = 0
+    last_midi = 0
+    for i, _ in enumerate(states_):
+        if my_state == silence:
+            if int(states_[i] % 2) != 0:
+                last_onset = i * hop_time
+                last_midi = ((states_[i] - 1) / 2) + midi_min
+                last_note = librosa.midi_to_note(last_midi)
+                my_state = onset
+        elif my_state == onset:
+            if int(states_[i] % 2) == 0:
+                my_state = sustain
+        elif my_state == sustain:
+            if int(states_[i] % 2) != 0:
+                output.append([last_onset, i * hop_time, last_midi, last_note])
+                last_onset = i * hop_time
+                last_midi = ((states_[i] - 1) / 2) + midi_min
+                last_note = librosa.midi_to_note(last_midi)
+                my_state = onset
+            elif states_[i] == 0:
+                output.append([last_onset, i * hop_time, last_midi, last_note])
+                my_state = silence
+
+    return output
+
+
+def test_states_to_pianoroll_matches_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n_notes = int(rng.integers(1, 13))
+        # Runs of random states, so that notes last several frames
+        runs = rng.integers(0, 2 * n_notes + 1, size=rng.integers(0, 60))
+        states = np.repeat(runs, rng.integers(1, 5, size=len(runs)))
+        hop_time = rng.uniform(0.001, 0.1)
+
+        pianoroll = states_to_pianoroll(states, "A2", hop_time)
+        expected = _reference_states_to_pianoroll(states, "A2", hop_time)
+
+        assert len(pianoroll) == len(expected)
+        for note, expected_note in zip(pianoroll, expected):
+            assert note[0] == pytest.approx(expected_note[0])
+            assert note[1] == pytest.approx(expected_note[1])
+            assert note[2] == expected_note[2]
+            assert note[3] == expected_note[3]
+
+
+@pytest.mark.parametrize("srate", [44100, 48000])
+def test_downsample_keeps_frame_times(srate):
+    frame_length = 2048
+    hop_length = 512
+    audio_signal = np.random.default_rng(0).uniform(-1, 1, srate * 2)
+
+    signal, new_srate, new_frame_length, new_hop_length = _downsample(
+        audio_signal, srate, frame_length, hop_length, 22050)
+
+    assert 22050 <= new_srate < srate
+    assert new_hop_length / new_srate == pytest.approx(hop_length / srate)
+    assert new_frame_length / new_srate == pytest.approx(
+        frame_length / srate, rel=1e-3)
+    assert len(signal) / new_srate == pytest.approx(
+        len(audio_signal) / srate, abs=1 / new_srate)
+    assert 1 + len(signal) // new_hop_length == \
+        1 + len(audio_signal) // hop_length
+
+
+@pytest.mark.parametrize("srate", [22050, 44100, 48000])
+def test_frame_features_time_grid(srate):
+    hop_length = 512
+    # A4 from 0.5 s to 1.5 s
+    audio_signal = np.concatenate((
+        np.zeros(srate // 2),
+        librosa.tone(440.0, sr=srate, duration=1.0),
+        np.zeros(srate // 2)))
+
+    pitch, voiced_flag, onset_env = _frame_features(
+        audio_signal, librosa.note_to_hz("A2"), librosa.note_to_hz("E5"),
+        srate, 2048, hop_length)
+
+    n_frames = 1 + len(audio_signal) // hop_length
+    assert len(pitch) == len(voiced_flag) == len(onset_env) == n_frames
+
+    times = librosa.frames_to_time(
+        np.flatnonzero(voiced_flag), sr=srate, hop_length=hop_length)
+    hop_time = hop_length / srate
+    assert times[0] == pytest.approx(0.5, abs=4 * hop_time)
+    assert times[-1] == pytest.approx(1.5, abs=4 * hop_time)
+    assert np.nanmedian(pitch) == pytest.approx(440.0, rel=0.01)
+    # The abrupt end of the tone is an onset too, so only look before it
+    onset_time = librosa.frames_to_time(
+        np.argmax(onset_env[:n_frames // 2]), sr=srate, hop_length=hop_length)
+    assert onset_time == pytest.approx(0.5, abs=4 * hop_time)
+
+
+@pytest.mark.parametrize("pitch_backend", ["pyin", "pyworld", "torchcrepe"])
+@pytest.mark.parametrize("center", [True, False])
+def test_pitch_backends(pitch_backend, center):
+    if pitch_backend != "pyin":
+        pytest.importorskip(pitch_backend)
+    srate = 22050
+    hop_length = 512
+    frame_length = 2048
+    # A4 until 2 s, then C5
+    audio_signal = np.concatenate((
+        librosa.tone(440.0, sr=srate, duration=2.0),
+        librosa.tone(librosa.note_to_hz("C5"), sr=srate, duration=1.0)))
+
+    pitch, voiced_flag, _ = _frame_features(
+        audio_signal, librosa.note_to_hz("A2"), librosa.note_to_hz("E5"),
+        srate, frame_length, hop_length, center=center,
+        pitch_backend=pitch_backend)
+
+    if center:
+        n_frames = 1 + len(audio_signal) // hop_length
+        offset = 0
+    else:
+        n_frames = 1 + (len(audio_signal) - frame_length) // hop_length
+        offset = frame_length / 2
+    assert len(pitch) == len(voiced_flag) == n_frames
+    assert np.all(np.isnan(pitch[~voiced_flag]))
+    assert np.nanmedian(pitch[:n_frames // 2]) == pytest.approx(440.0, rel=0.01)
+
+    # Frame centers, in seconds
+    times = (np.arange(n_frames) * hop_length + offset) / srate
+    change_time = times[np.flatnonzero(pitch > 480)[0]]
+    assert change_time == pytest.approx(2.0, abs=2 * hop_length / srate)
+
+
+def test_unknown_pitch_backend():
+    with pytest.raises(ValueError):
+        _frame_features(
+            np.zeros(22050), 110.0, 660.0, 22050, 2048, 512,
+            pitch_backend="yin")
+
+
+@pytest.mark.parametrize("n_samples", [0, 100, 2047, 2048])
+def test_prior_probabilities_shorter_than_a_frame(n_samples):
+    audio_signal = np.zeros(n_samples, dtype=np.float32)
+    n_frames = 1 if n_samples >= 2048 else 0
+
+    priors = prior_probabilities(
+        audio_signal, "A2", "E5", 22050, center=False)
+    blocks = list(iter_prior_probabilities(
+        audio_signal, "A2", "E5", 22050, center=False))
+
+    assert priors.shape == (65, n_frames)
+    assert len(blocks) == n_frames
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import librosa
+
+from sound_to_midi.monophonic import transition_matrix
+from sound_to_midi._viterbi import viterbi_sparse_blocks
+
+_EPSILON = np.finfo(np.float64).tiny
+
+
+def _random_model(rng):
+    n_notes = int(rng.integers(1, 13))
+    n_frames = int(rng.integers(2, 300))
+    note_min = "C4"
+    note_max = librosa.midi_to_note(60 + n_notes - 1)
+    transmat = transition_matrix(
+        note_min, note_max,
+        p_stay_note=rng.uniform(0.05, 0.95),
+        p_stay_silence=rng.uniform(0.05, 0.95)).astype(np.float64)
+    priors = rng.uniform(size=(2 * n_notes + 1, n_frames))
+    p_init = np.zeros(2 * n_notes + 1)
+    p_init[0] = 1
+    return priors, transmat, p_init
+
+
+def test_viterbi_sparse_matches_librosa():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        priors, transmat, p_init = _random_model(rng)
+        expected = librosa.sequence.viterbi(priors, transmat, p_init=p_init)
+
+        log_transmat = np.log(transmat + _EPSILON)
+        states = viterbi_sparse_blocks(
+            [(np.log(priors + _EPSILON), 0)],
+            np.log(p_init + _EPSILON),
+            log_transmat[0, 0],
+            log_transmat[0, 1],
+            log_transmat[2, 2],
+            log_transmat[2, 0])
+
+        np.testing.assert_array_equal(states, expected)
+
+
+
+def _blocks(log_p, rng):
+    n_frames = log_p.shape[1]
+    n_cuts = int(rng.integers(0, 5))
+    bounds = np.unique(np.concatenate((
+        [0, n_frames], rng.integers(0, n_frames, size=n_cuts))))
+    for t0, t1 in zip(bounds[:-1], bounds[1:]):
+        yield log_p[:, t0:t1], t0
+
+
+def test_viterbi_sparse_blocks_matches_whole_matrix():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        priors, transmat, p_init = _random_model(rng)
+        log_p = np.log(priors + _EPSILON)
+        log_transmat = np.log(transmat + _EPSILON)
+        args = (
+            np.log(p_init + _EPSILON),
+            log_transmat[0, 0],
+            log_transmat[0, 1],
+            log_transmat[2, 2],
+            log_transmat[2, 0])
+
+        np.testing.assert_array_equal(
+            viterbi_sparse_blocks(_blocks(log_p, rng), *args),
+            viterbi_sparse_blocks([(log_p, 0)], *args))
+
+
+def test_viterbi_sparse_blocks_empty():
+    states = viterbi_sparse_blocks(
+        [], np.zeros(3), 0.0, 0.0, 0.0, 0.0)
+    assert len(states) == 0